@@ -1,17 +1,28 @@
 import os
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
-from fastapi import FastAPI, UploadFile, HTTPException
+from fastapi import Depends, FastAPI, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from contextlib import asynccontextmanager
 from pathlib import Path
-import shutil
+import aiofiles
+import asyncio
+import orjson
 import os
 
 from src.models.schemas import ChatRequest
 from src.core.rag_system import RAGSystem
 
-app = FastAPI(title="RAG API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the RAG system (LLM, embeddings, reranker) and saved index once at startup."""
+    app.state.rag = await asyncio.to_thread(RAGSystem)
+    # Load the saved index now so the first /chat doesn't pay for it
+    await asyncio.to_thread(app.state.rag.vector_store.load_vector_store)
+    yield
+
+app = FastAPI(title="RAG API", lifespan=lifespan, default_response_class=ORJSONResponse)
 FRONT_END_URLS = os.getenv("ALLOWED_ORIGINS").split(',')
 origins = [url.strip() for url in FRONT_END_URLS if url.strip()]
 
@@ -42,57 +53,79 @@ async def root():
         }
     })
 
-# Initialize RAG system
-rag_system = RAGSystem()
+def get_rag_system(request: Request) -> RAGSystem:
+    """Return the RAG system shared by all requests of this worker."""
+    return request.app.state.rag
 
 @app.post("/upload")
-async def upload_document(file: UploadFile):
+async def upload_document(file: UploadFile, rag_system: RAGSystem = Depends(get_rag_system)):
     """Upload and index a document."""
     try:
         # Save the uploaded file
         file_path = Path(f"documents/{file.filename}")
         os.makedirs(file_path.parent, exist_ok=True)
         
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await file.read(1 << 20):  # 1 MiB at a time
+                await buffer.write(chunk)
         
-        # Process and index the document
-        num_chunks = rag_system.process_and_index_document(file_path)
+        # Process and index the document off the event loop, one index change at a time
+        async with rag_system.index_lock:
+            num_chunks = await asyncio.to_thread(rag_system.process_and_index_document, file_path)
         
         return {"message": f"Successfully processed and indexed {num_chunks} chunks from {file.filename}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse(payload: dict) -> bytes:
+    """Frame a payload as a Server-Sent Events message."""
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
 @app.post("/chat")
-async def chat(request: ChatRequest):
-    """Query the document with conversation history."""
+async def chat(request: ChatRequest, rag_system: RAGSystem = Depends(get_rag_system)):
+    """Query the document with conversation history, streaming the answer over SSE.
+
+    The first event carries the sources, the following ones carry answer deltas.
+    """
+    events = rag_system.stream_query_document(
+        query=request.query,
+        conversation_id=request.conversation_id
+    )
     try:
-        answer, source_docs = rag_system.query_document(
-            query=request.query,
-            conversation_id=request.conversation_id
-        )
-        
-        sources = [
-            {
-                "page": doc.metadata.get("page", "Unknown"),
-                "chunk": doc.metadata.get("chunk", "Unknown"),
-                "source": doc.metadata.get("source", "Unknown")
-            }
-            for doc in source_docs
-        ]
-        
-        return {
-            "answer": answer,
-            "sources": sources
-        }
+        # Run retrieval before responding so setup failures still return a 500
+        source_docs = (await anext(events))["sources"]
     except Exception as e:
+        await events.aclose()
         raise HTTPException(status_code=500, detail=str(e))
+    
+    sources = [
+        {
+            "page": doc.metadata.get("page", "Unknown"),
+            "chunk": doc.metadata.get("chunk", "Unknown"),
+            "source": doc.metadata.get("source", "Unknown")
+        }
+        for doc in source_docs
+    ]
+    
+    async def event_stream():
+        try:
+            yield _sse({"sources": sources})
+            async for event in events:
+                yield _sse(event)
+        except Exception as e:
+            yield _sse({"error": str(e)})
+        finally:
+            # Release the conversation lock right away if the client disconnects mid-stream
+            await events.aclose()
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 @app.delete("/clear")
-async def clear_index():
+async def clear_index(rag_system: RAGSystem = Depends(get_rag_system)):
     """Clear the vector store and indexed documents."""
     try:
-        rag_system.clear_vector_store()
+        async with rag_system.index_lock:
+            rag_system.clear_vector_store()
         return {"message": "Vector store cleared successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -14,6 +14,11 @@ DATA_DIR = ROOT_DIR / "data"
 RAW_DATA_DIR = DATA_DIR / "raw"
 PROCESSED_DATA_DIR = DATA_DIR / "processed"
 VECTOR_STORE_PATH = PROCESSED_DATA_DIR / "faiss_index"
+EMBEDDING_CACHE_PATH = DATA_DIR / "cache" / "embeddings"
+# Chunk vectors are bounded by what gets indexed. Query vectors grow with every distinct
+# question and its expansions, so they live apart and are deleted on /clear.
+DOCUMENT_EMBEDDING_CACHE_PATH = EMBEDDING_CACHE_PATH / "documents"
+QUERY_EMBEDDING_CACHE_PATH = EMBEDDING_CACHE_PATH / "queries"
 
 # Model settings
 EMBEDDING_MODEL = "models/embedding-001"
@@ -25,3 +30,15 @@ CHUNK_OVERLAP = 150
 
 # Search settings
 TOP_K_RESULTS = 3
+ANN_MIN_VECTORS = 10_000  # Below this a flat (exact) index is fast enough
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Cache settings
+CACHE_SIMILARITY_THRESHOLD = 0.95
+CACHE_MAX_ENTRIES = 1000
+
+# Conversation settings
+MAX_CONVERSATIONS = 10_000  # Least recently used conversations are evicted beyond this
+MAX_CONVERSATION_MESSAGES = 20  # Older messages are dropped from each conversation
@@ -0,0 +1,79 @@
+from typing import Any, Dict, Optional
+import hashlib
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def _hash(text: str) -> str:
+    """Deterministic cache key for a piece of text."""
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        embeddings: Optional[Embeddings] = None,
+        similarity_threshold: float = 0.95,
+        max_entries: int = 1000
+    ):
+        """Initialize an in-memory cache for LLM responses.
+
+        Args:
+            embeddings: Embeddings model used for semantic lookup.
+                      If None, only exact matches are served.
+            similarity_threshold: Minimum cosine similarity for a semantic hit.
+            max_entries: Oldest entries are evicted beyond this size.
+        """
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self._entries: Dict[str, Any] = {}
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._pending_vectors: Dict[str, np.ndarray] = {}
+
+    async def _embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(await self.embeddings.aembed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def get(self, text: str) -> Optional[Any]:
+        """Return the cached value for text, falling back to the most similar cached text."""
+        key = _hash(text)
+        if key in self._entries:
+            return self._entries[key]
+        if self.embeddings is None:
+            return None
+
+        vector = await self._embed(text)
+        # Remember the vector so a following set() doesn't embed the same text again
+        if len(self._pending_vectors) >= self.max_entries:
+            self._pending_vectors.clear()
+        self._pending_vectors[key] = vector
+        if not self._vectors:
+            return None
+
+        keys = list(self._vectors)
+        similarities = np.vstack([self._vectors[k] for k in keys]) @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.similarity_threshold:
+            return self._entries[keys[best]]
+        return None
+
+    async def set(self, text: str, value: Any):
+        """Store value under text."""
+        key = _hash(text)
+        if len(self._entries) >= self.max_entries and key not in self._entries:
+            oldest = next(iter(self._entries))
+            self._entries.pop(oldest)
+            self._vectors.pop(oldest, None)
+
+        self._entries[key] = value
+        if self.embeddings is not None:
+            vector = self._pending_vectors.pop(key, None)
+            self._vectors[key] = vector if vector is not None else await self._embed(text)
+
+    def clear(self):
+        """Drop all cached entries."""
+        self._entries.clear()
+        self._vectors.clear()
+        self._pending_vectors.clear()
@@ -1,6 +1,14 @@
 from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from langchain.prompts import PromptTemplate
-from src.config.settings import GOOGLE_API_KEY, LLM_MODEL, EMBEDDING_MODEL
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from src.config.settings import (
+    GOOGLE_API_KEY,
+    LLM_MODEL,
+    EMBEDDING_MODEL,
+    DOCUMENT_EMBEDDING_CACHE_PATH,
+    QUERY_EMBEDDING_CACHE_PATH
+)
 
 def init_llm():
     """Initialize the LLM with custom prompt template."""
@@ -37,8 +45,18 @@ Answer:
     )
 
 def init_embeddings():
-    """Initialize the embeddings model."""
-    return GoogleGenerativeAIEmbeddings(
+    """Initialize the embeddings model, backed by an on-disk cache keyed by text hash."""
+    underlying = GoogleGenerativeAIEmbeddings(
         model=EMBEDDING_MODEL,
         google_api_key=GOOGLE_API_KEY,
     )
+    # Cache indexed chunks and (expanded) user queries in separate stores: the model embeds
+    # them with different task types, so the same text must not share a vector. Keys are
+    # namespaced by model so switching models never serves stale vectors
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying,
+        LocalFileStore(str(DOCUMENT_EMBEDDING_CACHE_PATH)),
+        namespace=EMBEDDING_MODEL,
+        query_embedding_cache=LocalFileStore(str(QUERY_EMBEDDING_CACHE_PATH)),
+        key_encoder="sha256"
+    )
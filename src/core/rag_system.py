@@ -1,74 +1,65 @@
 from pathlib import Path
-from typing import Optional, List, Tuple
-from langchain.schema import Document
-from langchain.chains import ConversationalRetrievalChain, RetrievalQA
-from langchain.prompts import PromptTemplate
+from typing import AsyncIterator
 from langchain.memory import ConversationBufferMemory
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_community.vectorstores.faiss import FAISS
+from collections import OrderedDict
+import asyncio
+import logging
 import re
 
 from src.document_processing.processor import DocumentProcessor
 from src.core.vectorstore import VectorStore
 from src.core.llm import init_llm
 from src.core.reranking import CrossEncoderReranker
+from src.core.cache import ResponseCache
+from src.config.settings import (
+    CACHE_SIMILARITY_THRESHOLD,
+    CACHE_MAX_ENTRIES,
+    MAX_CONVERSATIONS,
+    MAX_CONVERSATION_MESSAGES,
+    QUERY_EMBEDDING_CACHE_PATH
+)
+
+logger = logging.getLogger(__name__)
+
+# Static instructions for the final answer. Kept byte-identical across requests and sent
+# before history and retrieved passages so provider-side prompt prefix caching can hit.
+ANSWER_SYSTEM_PROMPT = """You will be given passages ranked by relevance to the user's question.
+
+Please provide a comprehensive answer that:
+1. Synthesizes information from all relevant passages
+2. Uses clear examples and relevant quotes
+3. Breaks down complex concepts into easy-to-understand parts
+4. Uses a clear structure with sections and bullet points
+5. Provides code examples if relevant
+6. Maintains natural flow between concepts
+
+Important: Do not mention page numbers, chunks, or source references in your answer.
+Focus on delivering the information in a clear, user-friendly way.
+If certain passages contradict each other, acknowledge this and explain the different perspectives.
+Previous conversation context should be considered for a coherent dialogue."""
+
+# Leading list numbering such as "1. " or "2) " in expansion output
+_NUM_PREFIX = re.compile(r'^\d+[.)]\s*')
 
 class RAGSystem:    
     def __init__(self):
         self.document_processor = DocumentProcessor()
         self.vector_store = VectorStore()
         self.llm = init_llm()
-        self.qa_chain = None
-        self._current_search_type = None
         self.reranker = CrossEncoderReranker()
-        self.conversations = {}  # Store conversations by ID
-        
-    def get_prompt_templates(self) -> tuple[PromptTemplate, PromptTemplate]:
-        """Generate the prompt templates based on the current document."""
-        doc_name = self.vector_store.get_source_document_name() or "the provided document"
-        
-        initial_template = f"""You are an expert helping developers understand concepts from {doc_name}.
-Use the following context to answer the question. Please:
-- Break down complex concepts into digestible parts
-- Use bullet points for clarity where appropriate
-- Include relevant code examples when helpful
-- Keep explanations precise but thorough
-- Cite page numbers and relevant sections when available
-- If you don't know the answer, say so instead of making it up
-
-Context: {{context}}
-Question: {{question}}
-
-Answer: Let's explain this step by step:"""
-
-        refine_template = f"""You are an expert helping developers understand concepts from {doc_name}.
-
-Here's the original question: {{question}}
-
-We have already provided the following explanation:
-{{existing_answer}}
-
-Now we have found some additional context: {{context}}
-
-Please refine the explanation by:
-1. Adding any new important information
-2. Correcting any inaccuracies
-3. Maintaining clear formatting with bullet points
-4. Including page numbers and citations where available
-5. Adding relevant code examples if new ones are found
-
-Updated answer:"""
-
-        initial_prompt = PromptTemplate(
-            template=initial_template,
-            input_variables=["context", "question"]
+        self.conversations = OrderedDict()  # Store conversations by ID, least recently used first
+        self._conversation_locks = {}  # Serialize concurrent turns per conversation
+        self.index_lock = asyncio.Lock()  # Serialize /upload and /clear, which rewrite the saved index
+        # Paraphrased questions reuse expansions; answers are keyed by question + retrieved context
+        self.expansion_cache = ResponseCache(
+            embeddings=self.vector_store.embeddings,
+            similarity_threshold=CACHE_SIMILARITY_THRESHOLD,
+            max_entries=CACHE_MAX_ENTRIES
         )
+        self.answer_cache = ResponseCache(max_entries=CACHE_MAX_ENTRIES)
         
-        refine_prompt = PromptTemplate(
-            template=refine_template,
-            input_variables=["question", "existing_answer", "context"]
-        )
-        
-        return initial_prompt, refine_prompt
-
     def process_and_index_document(self, file_path: Path) -> int:
         """Process a document and index it in the vector store."""
         chunks = self.document_processor.process_document(file_path)
@@ -79,91 +70,111 @@ Updated answer:"""
         self.vector_store.save_vector_store()
         return len(chunks)
         
-    def setup_qa_chain(self, conversation_id: Optional[str] = None):
-        """Initialize the QA chain with the vector store retriever."""
-        if not self.vector_store.vector_store:
-            self.vector_store.load_vector_store()
-        
-        if not self.vector_store.vector_store:
+    async def ensure_vector_store(self) -> FAISS:
+        """Return the loaded vector store, reading it from disk off the event loop if needed."""
+        store = self.vector_store.vector_store or await asyncio.to_thread(self.vector_store.load_vector_store)
+        if not store:
             raise ValueError("No vector store available. Please index documents first.")
-
-        # Use memory for chat sessions
-        memory = self.conversations.get(conversation_id) if conversation_id else None
-
-        # Retrieve more documents initially for better reranking
-        base_retriever = self.vector_store.vector_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 10}  # Get more documents for reranking
-        )
-
-        if conversation_id:
-            self.qa_chain = ConversationalRetrievalChain.from_llm(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=base_retriever,
-                memory=memory,
-                return_source_documents=True,
-                verbose=False
-            )
-        else:
-            self.qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=base_retriever,
-                return_source_documents=True
-            )
+        return store
             
-    def expand_query(self, question: str) -> list[str]:
+    async def expand_query(self, question: str) -> list[str]:
         """Generate related questions for multiple query expansion."""
+        cached = await self.expansion_cache.get(question)
+        if cached is not None:
+            return [question] + cached
+
         expansion_prompt = f"""Given the user question: "{question}"
 
 Please generate 5 related but more specific questions that would help provide a comprehensive answer.
 Return only the questions as a numbered list without any introduction or explanation."""
 
-        expansion_response = self.llm.invoke(expansion_prompt)
+        expansion_response = await self.llm.ainvoke(expansion_prompt)
         content = expansion_response.content if hasattr(expansion_response, 'content') else str(expansion_response)
         
         expanded_questions = []
         for q in content.split('\n'):
             q = q.strip()
-            if q and any(c.isdigit() for c in q[:2]):
-                q = re.sub(r'^\d+\.\s*', '', q)
+            if q[:1].isdigit():
+                q = _NUM_PREFIX.sub('', q)
                 expanded_questions.append(q)
-        # Print expanded queries for visibility
-        print("\nGenerated expanded queries:")
-        for i, q in enumerate(expanded_questions, 1):
-            print(f"{i}. {q}")
-            print()
+        logger.debug("expanded queries: %s", expanded_questions)
         
+        await self.expansion_cache.set(question, expanded_questions)
         return [question] + expanded_questions
         
-    def query_document(self, query: str, conversation_id: str) -> tuple[str, List[Document]]:
-        """Query the document using multiple query expansion and cross-encoder reranking."""
-        if conversation_id not in self.conversations:
-            self.conversations[conversation_id] = ConversationBufferMemory(
-                memory_key="chat_history",
-                return_messages=True,
-                output_key="answer",
-                input_key="question"
-            )
-        self.setup_qa_chain(conversation_id=conversation_id)
+    async def stream_query_document(self, query: str, conversation_id: str) -> AsyncIterator[dict]:
+        """Query the document using multiple query expansion and cross-encoder reranking,
+        streaming the answer as it is generated.
+
+        Yields {"sources": [Document, ...]} once retrieval and reranking are done,
+        then {"delta": str} chunks of the answer.
+        """
+        lock = self._conversation_locks.setdefault(conversation_id, asyncio.Lock())
+        async with lock:
+            async for event in self._stream_query_document(query, conversation_id):
+                yield event
+
+    def _get_conversation(self, conversation_id: str) -> ConversationBufferMemory:
+        """Return the memory for a conversation, creating it and evicting the least recently used if needed."""
+        memory = self.conversations.get(conversation_id)
+        if memory is not None:
+            self.conversations.move_to_end(conversation_id)
+            return memory
+
+        memory = ConversationBufferMemory(
+            memory_key="chat_history",
+            return_messages=True,
+            output_key="answer",
+            input_key="question"
+        )
+        self.conversations[conversation_id] = memory
+        self._evict_conversations()
+        return memory
+
+    def _evict_conversations(self):
+        """Drop least recently used conversations beyond MAX_CONVERSATIONS.
+
+        Conversations whose lock is held are skipped: dropping that lock would let the next
+        request for the same id run concurrently with the one holding or awaiting it.
+        """
+        excess = len(self.conversations) - MAX_CONVERSATIONS
+        for candidate_id in list(self.conversations):
+            if excess <= 0:
+                break
+            lock = self._conversation_locks.get(candidate_id)
+            if lock is not None and lock.locked():
+                continue
+            del self.conversations[candidate_id]
+            self._conversation_locks.pop(candidate_id, None)
+            excess -= 1
+
+    async def _stream_query_document(self, query: str, conversation_id: str) -> AsyncIterator[dict]:
+        # Hold a reference so eviction by other requests can't drop this turn's memory
+        memory = self._get_conversation(conversation_id)
+        # Fail before the expansion LLM call when nothing is indexed
+        store = await self.ensure_vector_store()
 
         # Generate expanded queries (fixed at 5 queries)
-        expanded_queries = self.expand_query(query)
+        expanded_queries = await self.expand_query(query)
         all_docs = []
-        seen_content = set()
+        seen_hashes: set[int] = set()  # Hashes only, no need to keep the chunk text alive
         
-        # Process each expanded query to gather relevant documents
-        for expanded_q in expanded_queries:
-            response = self.qa_chain.invoke({"question": expanded_q})
-            if 'source_documents' in response:
-                for doc in response['source_documents']:
-                    if doc.page_content not in seen_content:
-                        all_docs.append(doc)
-                        seen_content.add(doc.page_content)
+        # Retrieve for all expanded queries with concurrent embeds + one batched FAISS search
+        results = await self.vector_store.batch_similarity_search(
+            expanded_queries,
+            k=10,  # Get more documents for reranking
+            store=store
+        )
+        for docs in results:
+            for doc in docs:
+                content_hash = hash(doc.page_content)
+                if content_hash not in seen_hashes:
+                    seen_hashes.add(content_hash)
+                    all_docs.append(doc)
         
         # Apply cross-encoder reranking with relevance scores
-        reranked_docs = self.reranker.rerank_documents(
+        reranked_docs = await asyncio.to_thread(
+            self.reranker.rerank_documents,
             query=query,
             documents=all_docs,
             top_k=10  # Keep more relevant documents
@@ -175,46 +186,58 @@ Return only the questions as a numbered list without any introduction or explana
             for idx, (doc, score) in enumerate(reranked_docs)
         ])
         
-        # Create a detailed prompt that encourages comprehensive answers
-        detailed_prompt = f"""Based on the following passages ranked by relevance to the question: "{query}"
+        yield {"sources": [doc for doc, _ in reranked_docs]}
+
+        # Reuse the answer only while the history, question and retrieved passages are all
+        # unchanged, so one conversation never receives an answer built from another's history
+        conversation_history = list(memory.chat_memory.messages)
+        answer_key = "\n".join(
+            [f"{message.type}: {message.content}" for message in conversation_history]
+            + [query, reranked_context]
+        )  # Hashed by the cache
+        answer = await self.answer_cache.get(answer_key)
+        if answer is not None:
+            yield {"delta": answer}
+        else:
+            # Order messages from most to least stable: instructions, history, then this turn
+            messages = [
+                SystemMessage(content=ANSWER_SYSTEM_PROMPT),
+                *conversation_history,
+                HumanMessage(content=f"""Passages ranked by relevance to the question:
 
 {reranked_context}
 
-Please provide a comprehensive answer that:
-1. Synthesizes information from all relevant passages
-2. Uses clear examples and relevant quotes
-3. Breaks down complex concepts into easy-to-understand parts
-4. Uses a clear structure with sections and bullet points
-5. Provides code examples if relevant
-6. Maintains natural flow between concepts
-
-Important: Do not mention page numbers, chunks, or source references in your answer.
-Focus on delivering the information in a clear, user-friendly way.
-If certain passages contradict each other, acknowledge this and explain the different perspectives.
-Previous conversation context should be considered for a coherent dialogue.
-
-Question: {query}
-"""
-        # Generate final response using conversation memory
-        conversation_history = self.conversations[conversation_id].chat_memory.messages
-        final_response = self.llm.invoke(detailed_prompt + "\n\nPrevious conversation context:\n" + 
-                                       str(conversation_history) if conversation_history else "")
-        
-        answer = final_response.content if hasattr(final_response, 'content') else str(final_response)
+Question: {query}""")
+            ]
+            answer_parts = []
+            async for chunk in self.llm.astream(messages):
+                delta = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                if delta:
+                    answer_parts.append(delta)
+                    yield {"delta": delta}
+            
+            answer = "".join(answer_parts)
+            await self.answer_cache.set(answer_key, answer)
         
-        # Update conversation memory
-        self.conversations[conversation_id].save_context(
+        # Update conversation memory once the full answer is known
+        memory.save_context(
             {"question": query},
             {"answer": answer}
         )
-            
-        return answer, [doc for doc, _ in reranked_docs]
+        # Compact long conversations down to the most recent turns
+        if len(memory.chat_memory.messages) > MAX_CONVERSATION_MESSAGES:
+            memory.chat_memory.messages = memory.chat_memory.messages[-MAX_CONVERSATION_MESSAGES:]
 
     def clear_vector_store(self):
-        """Clear the vector store and its saved files."""
+        """Clear the vector store, its saved files, cached LLM responses and cached query embeddings."""
+        import shutil
+        self.expansion_cache.clear()
+        self.answer_cache.clear()
+        # The query embedding cache has no size limit, so /clear is where it is reclaimed
+        if QUERY_EMBEDDING_CACHE_PATH.exists():
+            shutil.rmtree(QUERY_EMBEDDING_CACHE_PATH)
         if self.vector_store:
             self.vector_store.vector_store = None
             index_dir = Path("data/processed/faiss_index")
             if index_dir.exists():
-                import shutil
                 shutil.rmtree(index_dir)
@@ -1,5 +1,6 @@
 from typing import List, Tuple, Dict
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
+import threading
 import torch
 from langchain_core.documents import Document
 
@@ -17,6 +18,12 @@ class CrossEncoderReranker:
         # Use GPU if available
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.model = self.model.to(self.device)
+        if self.device.type == "cuda":
+            self.model = self.model.half()  # FP16 halves memory traffic per forward pass
+        self.model.eval()
+        # rerank_documents runs in worker threads; the fast tokenizer mutates its truncation/padding
+        # state per call ("Already borrowed" when shared) and forward passes share torch's thread pool
+        self._lock = threading.Lock()
         
     def rerank_documents(
         self,
@@ -34,14 +41,18 @@ class CrossEncoderReranker:
         Returns:
             List of (document, score) tuples sorted by relevance score.
         """
+        if not documents:
+            return []
+
         # Prepare text pairs for cross-encoder
         text_pairs = [(query, doc.page_content) for doc in documents]
         
-        # Get cross-encoder scores in batches
-        batch_size = 8  # Adjust based on available memory
+        # Score the pairs in large padded batches; retrieval returns at most a few dozen docs,
+        # so this is usually a single forward pass
+        batch_size = 32
         scores = []
         
-        with torch.no_grad():
+        with self._lock, torch.inference_mode():
             for i in range(0, len(text_pairs), batch_size):
                 batch = text_pairs[i:i + batch_size]
                 inputs = self.tokenizer(
@@ -53,7 +64,7 @@ class CrossEncoderReranker:
                 ).to(self.device)
                 
                 outputs = self.model(**inputs)
-                batch_scores = outputs.logits.squeeze(-1).cpu().numpy()
+                batch_scores = outputs.logits.squeeze(-1).float().cpu().numpy()
                 scores.extend(batch_scores)
                 
         # Create document-score pairs and sort by score
@@ -1,8 +1,19 @@
 from typing import List, Optional
+import asyncio
 import os
 from pathlib import Path
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores.faiss import FAISS
-from src.config.settings import VECTOR_STORE_PATH
+from langchain_core.documents import Document
+from src.config.settings import (
+    VECTOR_STORE_PATH,
+    ANN_MIN_VECTORS,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH
+)
 from src.core.llm import init_embeddings
 
 class VectorStore:
@@ -11,12 +22,30 @@ class VectorStore:
         self.vector_store = None
 
     def create_vector_store(self, texts: List[str], metadatas: Optional[List[dict]] = None):
-        """Create a new vector store from the given texts."""
-        self.vector_store = FAISS.from_texts(
-            texts=texts,
-            embedding=self.embeddings,
-            metadatas=metadatas
+        """Create a new vector store from the given texts.
+
+        Small corpora get an exact flat index; larger ones an HNSW graph so search stays
+        sublinear in the number of chunks.
+        """
+        if len(texts) < ANN_MIN_VECTORS:
+            self.vector_store = FAISS.from_texts(
+                texts=texts,
+                embedding=self.embeddings,
+                metadatas=metadatas
+            )
+            return self.vector_store
+
+        vectors = self.embeddings.embed_documents(texts)
+        index = faiss.IndexHNSWFlat(len(vectors[0]), HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        self.vector_store = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={}
         )
+        self.vector_store.add_embeddings(zip(texts, vectors), metadatas=metadatas)
         return self.vector_store
 
     def save_vector_store(self):
@@ -27,12 +56,15 @@ class VectorStore:
 
     def load_vector_store(self) -> Optional[FAISS]:
         """Load the vector store from disk."""
-        if os.path.exists(VECTOR_STORE_PATH):
+        # The directory may exist empty (e.g. created by the Docker image), so check for the index itself
+        if os.path.exists(Path(VECTOR_STORE_PATH) / "index.faiss"):
             self.vector_store = FAISS.load_local(
                 VECTOR_STORE_PATH,
                 self.embeddings,
                 allow_dangerous_deserialization=True  # Only use this if you trust the source of the vector store
             )
+            if isinstance(self.vector_store.index, faiss.IndexHNSW):
+                self.vector_store.index.hnsw.efSearch = HNSW_EF_SEARCH
             return self.vector_store
         return None
 
@@ -53,6 +85,48 @@ class VectorStore:
             for doc, score in results
         ]
 
+    async def batch_similarity_search(
+        self,
+        queries: List[str],
+        k: int = 4,
+        store: Optional[FAISS] = None
+    ) -> List[List[Document]]:
+        """Embed all queries concurrently and search the FAISS index with a single batched lookup.
+
+        Searches the given store, or the currently loaded one; callers load it beforehand.
+        """
+        # Work on one snapshot: a concurrent /upload or /clear may replace self.vector_store
+        store = store or self.vector_store
+        if not store:
+            raise ValueError("No vector store available. Please create one first.")
+
+        # embed_query, not embed_documents: asymmetric models like Gemini need the
+        # retrieval-query task type for search queries
+        vectors = np.array(
+            await asyncio.gather(*[self.embeddings.aembed_query(q) for q in queries]),
+            dtype=np.float32
+        )
+        return await asyncio.to_thread(self._search_vectors, store, vectors, k)
+
+    @staticmethod
+    def _search_vectors(store: FAISS, vectors: np.ndarray, k: int) -> List[List[Document]]:
+        """Run one batched FAISS search and map the hits back to documents."""
+        if store._normalize_L2:
+            faiss.normalize_L2(vectors)
+
+        _, indices = store.index.search(vectors, k)
+        results = []
+        for row in indices:
+            docs = []
+            for i in row:
+                if i == -1:  # FAISS pads with -1 when fewer than k vectors exist
+                    continue
+                doc = store.docstore.search(store.index_to_docstore_id[i])
+                if isinstance(doc, Document):
+                    docs.append(doc)
+            results.append(docs)
+        return results
+
     def get_source_document_name(self) -> Optional[str]:
         """Get the name of the source document from the vector store metadata."""
         if not self.vector_store: